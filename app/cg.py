@@ -34,7 +34,7 @@ class CG:
         
         # Iterate through all sections
         for key in q_dict.keys():
-            logger.info('--- Generating cards for section "{}"'.format(key))
+            logger.info('--- Generating cards for section "%s"', key)
             # Extract questions and answers on the current section 
             questions = re.findall(r"Q:\s.*?(?=\nA:|\Z)", q_dict[key], re.DOTALL)
             answers = re.findall(r"A:\s.*?(?=\n+Q:|\Z)", q_dict[key], re.DOTALL)
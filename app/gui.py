@@ -10,12 +10,19 @@
 # This script defines the GUI class running the graphical interface of the Idlearn app. 
 
 import threading
+import queue
+import logging
+from logging.handlers import QueueHandler
 import customtkinter as ctk
 import tkinter
+from .logger import logger
 from .pipeline import Pipeline
 from .utils import get_toc
 
 
+# Number of ToC rows created between two redraws of the metadata frame
+TOC_BATCH_SIZE = 40
+
 ctk.set_appearance_mode("dark")  # Options: "System" (default), "Dark", "Light"
 #ctk.set_default_color_theme("blue")  # Other options: "dark-blue", "green", etc.
 
@@ -25,11 +32,20 @@ class ToplevelWindow(ctk.CTkToplevel):
     def __init__(self, master=None, text="Information Dialog"):
         super().__init__(master)
         self.geometry("400x100")
-        self.title = "Warning"
+        self.title("Warning")
         self.text = text
         self.label = ctk.CTkLabel(self, text=self.text)
         self.label.pack(padx=20, pady=20)
-        self.button_ok = ctk.CTkButton(self, text="OK", command=self.destroy())
+        # Hiding rather than destroying the window so that the next message can reuse it
+        self.button_ok = ctk.CTkButton(self, text="OK", command=self.withdraw)
+        self.button_ok.pack(padx=20, pady=(0, 20))
+
+    
+    def show(self, text):
+        self.text = text
+        self.label.configure(text=self.text)
+        self.deiconify()
+        self.focus()
 
 
 class MetadataFrame(ctk.CTkScrollableFrame):
@@ -42,8 +58,13 @@ class MetadataFrame(ctk.CTkScrollableFrame):
         self.title = title
         self.title = ctk.CTkLabel(self, text=self.title, fg_color="gray30", corner_radius=6)
         self.title.grid(row=0, column=0, padx=10, pady=(10, 0), sticky="ew", columnspan=2)
-        self.sections = []
+        # Selected ToC entries as tuples, and the position of every entry in the ToC
+        self.sections = set()
+        self._toc_index = {}
         self.toc_section = []
+        self.toc_pages = []
+        self._toc_data = []
+        self._toc_job = None
 
         # Create labels for PDF metadata visualization
         self.title_label = ctk.CTkLabel(self, text="Title: ", fg_color="transparent", anchor='w', justify="left")
@@ -59,24 +80,38 @@ class MetadataFrame(ctk.CTkScrollableFrame):
 
     
     def update_label_text(self, label, info):
-        text = label.cget("text")
         label.configure(text=info)
 
     
-    def update_metadata(self, doc):
+    def update_metadata(self, doc, toc=None):
         metadata = doc.metadata
-        self.update_label_text(self.title_info, metadata['title'])
-        self.update_label_text(self.author_info, metadata['author'])
-        self.create_toc_selection(doc)
+        # Updating all labels in one go and letting Tk redraw the frame once when idle
+        batch = {self.title_info: metadata['title'],
+                 self.author_info: metadata['author']}
+        for label, info in batch.items():
+            self.update_label_text(label, info)
+        self.create_toc_selection(toc if toc is not None else get_toc(doc))
+        self.after_idle(self.update_idletasks)
 
 
-    def create_toc_selection(self, doc):
-        for i, sec in enumerate(get_toc(doc)):
+    def create_toc_selection(self, toc):
+        self.clear_toc_selection()
+        self._toc_data = list(toc)
+        self._toc_index = {tuple(sec): i for i, sec in enumerate(self._toc_data)}
+        self._create_toc_rows(0)
+
+
+    # Creates the rows of the ToC in batches, yielding to the main loop in between so that 
+    # long ToCs don't freeze the window while their widgets are built
+    def _create_toc_rows(self, start):
+        end = min(start + TOC_BATCH_SIZE, len(self._toc_data))
+        for i in range(start, end):
+            sec = self._toc_data[i]
             idx = sec[0]
             sec_title = sec[1]
             page_idx = sec[2]
             checkvar = ctk.StringVar(value = 'off')
-            self.checkbox = ctk.CTkCheckBox(self, text=sec_title, command=self.add_section(sec),
+            self.checkbox = ctk.CTkCheckBox(self, text=sec_title, command=lambda s=sec: self.add_section(s),
                                             variable=checkvar, onvalue="on", offvalue="off", hover = True, 
                                             checkbox_width=16, checkbox_height=16)
             self.checkbox.grid(row=5+i, column=1, padx=20+40*(idx-1), pady=(0,0), sticky='w')
@@ -84,13 +119,36 @@ class MetadataFrame(ctk.CTkScrollableFrame):
             self.toc_section.append(self.checkbox)
             self.label = ctk.CTkLabel(self, text=page_idx, fg_color="transparent", anchor='e', justify="right")
             self.label.grid(row=5+i, column=2, padx=20, pady=(0, 0), sticky='e')
+            self.toc_pages.append(self.label)
+        if end < len(self._toc_data):
+            self._toc_job = self.after(1, self._create_toc_rows, end)
+        else:
+            self._toc_job = None
+            self.update_idletasks()
+
+
+    def clear_toc_selection(self):
+        if self._toc_job is not None:
+            self.after_cancel(self._toc_job)
+            self._toc_job = None
+        for widget in self.toc_section + self.toc_pages:
+            widget.destroy()
+        self.toc_section = []
+        self.toc_pages = []
+        self.sections = set()
 
 
     def add_section(self, section):
+        section = tuple(section)
         if section not in self.sections:
-            self.sections.append(section)
+            self.sections.add(section)
         else:
-            self.sections.remove(section)
+            self.sections.discard(section)
+
+
+    # Returns the selected sections in ToC order
+    def selected_sections(self):
+        return [list(sec) for sec in sorted(self.sections, key=self._toc_index.get)]
 
 
 class IdlearnApp(ctk.CTk):
@@ -99,6 +157,8 @@ class IdlearnApp(ctk.CTk):
         super().__init__()
 
         self.pipeline = None
+        # Whether a pipeline run is in progress, only one run being allowed at a time
+        self.running = False
 
         self.filename = None 
         self.outfolder = None
@@ -144,6 +204,17 @@ class IdlearnApp(ctk.CTk):
         self.metadata_frame = MetadataFrame(self, title="File Metadata")
         self.metadata_frame.grid(row=0, column=2, padx=10, pady=(10, 10), sticky='ewns', rowspan=3)
         
+        # Create status label showing the latest log message of a run
+        self.status_label = ctk.CTkLabel(self, text="", fg_color="transparent", anchor='w', justify="left")
+        self.status_label.grid(row=3, column=0, padx=20, pady=(0, 10), sticky='ew', columnspan=3)
+        
+        # Log records emitted by worker threads, displayed from the main loop
+        self.log_queue = queue.Queue()
+        self.log_handler = QueueHandler(self.log_queue)
+        self.log_handler.setLevel(logging.INFO)
+        logger.addHandler(self.log_handler)
+        self.after(50, self._drain_log_queue)
+        
         # Define top-level window
         self.toplevel_window = None
 
@@ -151,13 +222,44 @@ class IdlearnApp(ctk.CTk):
     def make_openfile(self):
         self.filename = tkinter.filedialog.askopenfilename()
         self.textbox_input.delete("0.0", "end")
-        self.textbox_input.insert("0.0", self.filename)
-        self.pipeline = Pipeline(self.filename, self.outfolder, self.check_cards())
-        if len(self.metadata_frame.toc_section) != 0:
-            for checkbox in self.metadata_frame.toc_section:
-                checkbox.destroy()
-            self.metadata_frame.toc_section = []
-        self.metadata_frame.update_metadata(self.pipeline.doc)
+        self.textbox_input.insert("0.0", "Loading…")
+        self.button_run.configure(state="disabled")
+        # Opening the document and reading its ToC off the main thread to keep the UI responsive
+        threading.Thread(target=self._load_pipeline, args=(self.filename,), daemon=True).start()
+
+
+    # Runs in a worker thread: Tk widgets are only updated from the main loop through after()
+    def _load_pipeline(self, filename):
+        try:
+            pipeline = Pipeline(filename)
+            toc = get_toc(pipeline.doc)
+        except Exception as e:
+            logger.error("Could not open file '%s': %s", filename, e)
+            self.after(0, self._on_pipeline_failed, filename)
+            return
+        self.after(0, self._on_pipeline_loaded, filename, pipeline, toc)
+
+
+    def _on_pipeline_loaded(self, filename, pipeline, toc):
+        # Ignoring the result if another file was selected in the meantime
+        if filename != self.filename:
+            return
+        self.pipeline = pipeline
+        self.textbox_input.delete("0.0", "end")
+        self.textbox_input.insert("0.0", filename)
+        self.metadata_frame.update_metadata(pipeline.doc, toc)
+        if not self.running:
+            self.button_run.configure(state="normal")
+
+
+    def _on_pipeline_failed(self, filename):
+        if filename != self.filename:
+            return
+        self.textbox_input.delete("0.0", "end")
+        self.textbox_input.insert("0.0", "No file selected")
+        self.filename = None
+        if not self.running:
+            self.button_run.configure(state="normal")
                                
     
     def make_outfolder(self):
@@ -167,15 +269,54 @@ class IdlearnApp(ctk.CTk):
 
     
     def make_run(self):
+        if self.running:
+            return
         if self.filename is not None:
             if self.outfolder is not None:
-                self.pipeline.run(self.metadata_frame.sections)
+                # Keeping the file and the run locked until the run ends, so that no second run 
+                # can write to the cache at the same time
+                self.running = True
+                self.button_run.configure(state="disabled")
+                self.button_filename.configure(state="disabled")
+                self.pipeline.configure(self.outfolder, self.check_cards())
+                # Running the extraction and LLM generation off the main thread
+                threading.Thread(target=self._run_pipeline, 
+                                 args=(self.pipeline, self.metadata_frame.selected_sections()), 
+                                 daemon=True).start()
             else:
                 self.open_toplevel(text="Select output folder")
         else:
             self.open_toplevel(text="Select input file")
 
     
+    # Runs in a worker thread: progress reaches the UI through the log queue
+    def _run_pipeline(self, pipeline, sections):
+        try:
+            pipeline.run(sections)
+        except Exception:
+            logger.exception("Pipeline run failed")
+        finally:
+            self.after(0, self._on_run_finished)
+
+
+    def _on_run_finished(self):
+        self.running = False
+        self.button_filename.configure(state="normal")
+        self.button_run.configure(state="normal")
+
+
+    def _drain_log_queue(self):
+        record = None
+        while True:
+            try:
+                record = self.log_queue.get_nowait()
+            except queue.Empty:
+                break
+        if record is not None:
+            self.status_label.configure(text=record.getMessage())
+        self.after(50, self._drain_log_queue)
+
+    
     def check_cards(self):
         if self.cards.get() == "on" :
             return True
@@ -184,7 +325,7 @@ class IdlearnApp(ctk.CTk):
 
     
     def open_toplevel(self, text):
-        if self.toplevel_window is None or self.toplevel_window.winfo_exists():
+        if self.toplevel_window is None or not self.toplevel_window.winfo_exists():
             self.toplevel_window = ToplevelWindow(self, text)
         else:
-            self.toplevel_window.focus()
+            self.toplevel_window.show(text)
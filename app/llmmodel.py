@@ -12,42 +12,104 @@
 # sections of the text and values to their associated text, using local quantized 
 # version of the mistral-7B-Instruct LLM model run via ollama.
 
+import asyncio
+import aiohttp
 import requests
+from requests.adapters import HTTPAdapter
 import subprocess
 import threading
 import shlex
+import time
 from huggingface_hub import login
 from huggingface_hub import InferenceClient
 from transformers import pipeline, AutoTokenizer, AutoModelForSeq2SeqLM
 
+# Seconds allowed to connect to Ollama, generations themselves can take minutes on CPU and 
+# are not bounded
+CONNECT_TIMEOUT = 3
+
 class LLMModel:
 
     def __init__(self, model = 'mistral:7B-instruct', temperature = 0.4):
         self.model = model
         self.temperature = temperature
+        # Keeping connections to Ollama alive across requests
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
 
 
     def ollama_is_running(self):
         try:
-            response = requests.get("http://localhost:11434")
+            response = self.session.get("http://localhost:11434", timeout=CONNECT_TIMEOUT)
             return response.status_code == 200
-        except requests.exceptions.ConnectionError:
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
             return False
 
     
+    # Launches Ollama if needed and waits until it answers, backing off exponentially
     def call(self):
         if self.ollama_is_running() == False:
-            subprocess.Popen(["ollama", "serve"])
+            # Detaching the server from our pipes and session so that it never blocks on them
+            subprocess.Popen(["ollama", "serve"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, 
+                             start_new_session=True)
+            for delay in (0.05, 0.1, 0.2, 0.4, 0.8, 1.6, 3.2):
+                time.sleep(delay)
+                if self.ollama_is_running():
+                    break
 
     
-    # Function prompting mistral/7B-Instruct and returning its output
-    def generate(self, prompt):
-        url = "http://localhost:11434/api/generate"
-        response = requests.post(url, json={
+    # Returns the body of a generation request to Ollama
+    def payload(self, prompt):
+        return {
             "model": self.model,
             "prompt": prompt,
             "stream": False,  # Set to True if you want streaming responses
             "system": "You are a helpful assistant that has insight in academic, theoretical knowledge in science and humanities, and that is able to accurately summarize complex texts concisely yet precisely without skipping important details, as well as generate insightful questions about these texts.",
             "temperature": self.temperature
-        })
+        }
+
+    
+    # Function prompting mistral/7B-Instruct and returning its output
+    def generate(self, prompt):
+        url = "http://localhost:11434/api/generate"
+        response = self.session.post(url, json=self.payload(prompt), timeout=(CONNECT_TIMEOUT, None))
         return response.json()["response"]
+
+    
+    # Asynchronous version of generate, sending the request through the given aiohttp session
+    async def _agenerate_one(self, session, prompt):
+        url = "http://localhost:11434/api/generate"
+        async with session.post(url, json=self.payload(prompt)) as response:
+            data = await response.json()
+        return data["response"]
+
+    
+    # Returns an aiohttp session whose connector bounds the number of requests in flight
+    def _asession(self, max_concurrency):
+        connector = aiohttp.TCPConnector(limit=max_concurrency)
+        # Only the socket connection is timed, requests queued behind the connector limit may 
+        # wait for as long as the generations ahead of them take
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=CONNECT_TIMEOUT)
+        return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    
+    # Function prompting the model with all prompts concurrently and yielding (index, output) 
+    # pairs as the requests complete, output being the raised exception for a failed request
+    async def agenerate_as_completed(self, prompts, max_concurrency=8):
+        async with self._asession(max_concurrency) as session:
+            async def generate(i, prompt):
+                try:
+                    return i, await self._agenerate_one(session, prompt)
+                except Exception as e:
+                    return i, e
+            
+            for task in asyncio.as_completed([generate(i, prompt) for i, prompt in enumerate(prompts)]):
+                yield await task
+
+    
+    # Function prompting the model with all prompts concurrently and returning the outputs in 
+    # the same order, a failed request leaving its exception in place of the output
+    async def agenerate(self, prompts, max_concurrency=8):
+        async with self._asession(max_concurrency) as session:
+            return await asyncio.gather(*(self._agenerate_one(session, prompt) for prompt in prompts), 
+                                        return_exceptions=True)
\ No newline at end of file
@@ -14,6 +14,7 @@
 import logging
 import os
 import datetime
+from logging.handlers import RotatingFileHandler
 
  # Create logs directory if it doesn't exist
 os.makedirs("logs", exist_ok=True)
@@ -22,8 +23,9 @@ os.makedirs("logs", exist_ok=True)
 logger = logging.getLogger("idlearn_logger")
 logger.setLevel(logging.DEBUG)  # Or INFO / WARNING
 
-# File handler
-file_handler = logging.FileHandler("logs/idlearn{}.log".format(datetime.datetime), mode='a', encoding='utf-8')
+# File handler (one file per run, rotated if it grows too large)
+stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+file_handler = RotatingFileHandler(f"logs/idlearn_{stamp}.log", maxBytes=5_000_000, backupCount=3, encoding='utf-8')
 file_handler.setLevel(logging.DEBUG)
 
 # Optional: also log to console
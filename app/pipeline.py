@@ -13,8 +13,12 @@
 
 import os
 import re
+import mmap
 import json
+import hashlib
 import random
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import pymupdf
 from app import config
 from .config import deck_id
@@ -22,23 +26,106 @@ from .utils import IdlearnCache, text_extract, write_markdown
 from .llmmodel import LLMModel
 from .cg import CG
 
+# Maximum number of generation requests sent to Ollama at the same time
+MAX_CONCURRENT_REQUESTS = 4
+
 class Pipeline:
     
-    def __init__(self, input_file, output_folder, cards=True):
-        self.deck_id = random.randint(0, 9999999999) 
-        config.deck_id = self.deck_id
-        self.cache = IdlearnCache()
-        self.model = LLMModel()
-        self.output_folder = output_folder
+    def __init__(self, input_file):
+        self.input_file = input_file
         self.doc = pymupdf.open(input_file)
+        # Set by configure() and run(), so that opening a file only costs opening the document
+        self.output_folder = None
+        self.cards = True
+        self.force_refresh = False
+        self.deck_id = None
+        self.cache = None
+        self.model = None
+        self.pdf_hash = None
+
+
+    def configure(self, output_folder, cards=True, force_refresh=False):
+        self.output_folder = output_folder
         self.cards = cards
+        # Re-extract the sections' text even if it is already cached
+        self.force_refresh = force_refresh
         
         
-    def run(self, sections):
+    # Returns the BLAKE2b digest of a file, fed from a memory map in chunks to keep memory flat 
+    # on large books
+    @staticmethod
+    def _file_hash(path, chunk_size=1 << 20):
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            # Empty files cannot be memory-mapped
+            if os.fstat(f.fileno()).st_size == 0:
+                return digest.hexdigest()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for i in range(0, len(mm), chunk_size):
+                    digest.update(mm[i:i + chunk_size])
+        return digest.hexdigest()
+
+
+    # Returns the text of the selected sections, from the cache if they were already extracted
+    def _extract_texts(self, sections):
         from .logger import logger
         
-        # Create the structure containing all texts from all subsections from PDF file
+        if self.pdf_hash is None:
+            self.pdf_hash = self._file_hash(self.input_file)
+        signature = hashlib.md5(json.dumps(sections).encode('utf-8')).hexdigest()
+        # Only the latest selection of each document is kept, so the cache does not grow with 
+        # every new selection
+        cached = self.cache.get_texts(self.pdf_hash)
+        # The page count guards against a stale entry for a document that was rewritten in place
+        if (not self.force_refresh and cached is not None and cached["signature"] == signature
+            and cached["page_count"] == self.doc.page_count):
+            logger.info("-- Found extracted text in cache")
+            return cached["texts"]
+        
         text_dict = text_extract(self.doc, sections)
+        self.cache.update_texts(self.pdf_hash, {"signature": signature, "page_count": self.doc.page_count, 
+                                                "texts": text_dict})
+        return text_dict
+
+
+    # Runs the generation jobs, updating the cache from the event loop only as each of them 
+    # completes, so that a failed request does not lose the outputs of the others. Returns the 
+    # number of failed jobs
+    async def _generate(self, jobs):
+        from .logger import logger
+        
+        failed = 0
+        prompts = [prompt for _, _, prompt in jobs]
+        with self.cache.batch():
+            # Bounding the number of requests in flight to avoid saturating the local model
+            async for i, output in self.model.agenerate_as_completed(prompts, MAX_CONCURRENT_REQUESTS):
+                key, update, _ = jobs[i]
+                if isinstance(output, Exception):
+                    logger.error("--- Generation failed for section '%s': %s", key, output)
+                    failed += 1
+                    continue
+                update(key, output)
+        return failed
+
+
+    def run(self, sections):
+        from .logger import logger
+        
+        # Loading the cache and the model, and drawing the deck ID, only once a run is requested
+        if self.cache is None:
+            self.cache = IdlearnCache()
+        if self.model is None:
+            self.model = LLMModel()
+        if self.deck_id is None:
+            self.deck_id = random.randint(0, 9999999999) 
+            config.deck_id = self.deck_id
+        
+        # Starting the LLM model by launching Ollama in a subprocess while the text is extracted
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            model_future = pool.submit(self.model.call)
+            # Create the structure containing all texts from all subsections from PDF file
+            text_dict = self._extract_texts(sections)
+            model_future.result()
         
         # Initialize dictionaries used for storing summaries and question sets
         sum_dict = self.cache.data["summaries"]
@@ -47,30 +134,36 @@ class Pipeline:
         # Iterate through all sections to generate their summary and question set
         logger.info("-- Starting summary and Q&A generation")
         
-        # Starting the LLM model by launching Ollama in a subprocess
-        self.model.call()
-
         # Start of LLM prompt asking for a complete, precise summary yet as concise as possible 
         summary_instruct = "You are an expert science and humanities educator. Given the following text, do two things: 1. Summarize it clearly, precisely and as concisely as precision allows. 2. Then, extract the key concepts or facts as 3–8 concise bullet points. Output them in the form: 'Summary: ... Key Concepts: ...'Text: {text}"
     
         # Start of LLM prompt asking for a set of 5 questions about a previously fed text
         questions_instruct = "You are an expert science and humanities educator. Given the following text, generate a set of five relevant questions and their answers, making sure to only output the questions and their answers in the form of 'Q: ... A:...'. Text: {text}"
         
+        # Collecting the prompts of every section still missing a summary or a question set, 
+        # as (key, cache update, prompt) triples
+        jobs = []
         for key in text_dict.keys():
             # Create summary and bullet points of each main_text entry and store it in sum_dict
             if not key in sum_dict.keys():
-                logger.info("--- Generating summary of section '{}'".format(key))
-                sum_dict[key] = self.model.generate(summary_instruct.format(text=text_dict[key]))
-                self.cache.update_summary(key, sum_dict[key])
+                logger.info("--- Generating summary of section '%s'", key)
+                jobs.append((key, self.cache.update_summary, summary_instruct.format(text=text_dict[key])))
             else:
-                logger.warning("--- Summary of section '{}' already exists, skipping")
+                logger.warning("--- Summary of section '%s' already exists, skipping", key)
             # Generate questions based on the text
             if not key in qa_dict.keys():
-                logger.info("--- Generating Q&A of section '{}'".format(key))
-                qa_dict[key] = self.model.generate(questions_instruct.format(text=text_dict[key]))
-                self.cache.update_qa(key, qa_dict[key])
+                logger.info("--- Generating Q&A of section '%s'", key)
+                jobs.append((key, self.cache.update_qa, questions_instruct.format(text=text_dict[key])))
             else:
-                logger.warning("--- Q&A of section '{}' already exists, skipping")
+                logger.warning("--- Q&A of section '%s' already exists, skipping", key)
+
+        # Sending all requests to Ollama concurrently, storing each output as soon as it arrives
+        failed = asyncio.run(self._generate(jobs))
+
+        # The outputs are incomplete, the successful ones are cached and skipped on the next run
+        if failed:
+            logger.error("-- %s generation(s) failed, run again to complete them before writing the outputs", failed)
+            return
 
         logger.info("-- Finished summary and Q&A generation")
         
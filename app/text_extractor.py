@@ -1,30 +1,151 @@
 import os
 import re
-from collections import Counter
+import array
+from collections import Counter, OrderedDict
 import json
+import numpy as np
 import pymupdf
 
+# Number of parsed pages kept in memory by TextExtractor
+PAGE_CACHE_SIZE = 64
+
+# Precompiled patterns used when merging spans and extracting the text
+_WS = re.compile(r'[\s\t]+')
+_WS_ONLY = re.compile(r'[\s\t]+$')
+# Reference lists ("[ 1 , 2 ]") and ranges ("[ 1 – 3 ]")
+_REFS = re.compile(r'(?:;\s)?\[\s(?:\d+(?:\s,\s+)?)+\s\]|(?:;\s)?\[\s\d+\s–\s\d+\s\]')
+_LPAR = re.compile(r'\(\s')
+_RPAR = re.compile(r'\s\)')
+_MULTISPACE = re.compile(r'\s+')
+# Single-character substitutions applied to every merged span: soft hyphens are dropped, 
+# non-breaking and typographic spaces become plain spaces
+_TBL = str.maketrans({'ﬁ': 'fi', 'ﬂ': 'fl', '\xad': '', '\xa0': ' ', 
+                      **{chr(c): ' ' for c in range(0x2000, 0x200b)}})
+_STRIP = re.compile(r'[ ,.:?!]')
+_PAGENUM = re.compile(r'\s?\d+\s?$')
+_SOFT_SPACE = re.compile(r'[\xad\xa0]\s')
+_PUNCT_CAP = re.compile(r'\s+([.,:?!]([A-Z]))')
+_LEADING_WORD = re.compile(r'[a-z]+(\.)?\s?\w+')
+_LEADING_WORD_SUB = re.compile(r'^[a-z]+(\.)?\s?(\w+)')
+
+
+# Returns the text of a section cleaned up once all its spans are joined
+def _clean_section_text(text):
+    text = _SOFT_SPACE.sub('', text)
+    text = _PUNCT_CAP.sub(r'\1 \2', text)
+    if text.startswith('. '): 
+        text = text[2:] 
+    if _LEADING_WORD.match(text):
+        text = _LEADING_WORD_SUB.sub(r'\2', text)
+    return text
+
+
+# Returns a mask of the blocks of a page lying between its header and footer margins
+def _body_mask(blocks, pheight, pframe):
+    bbox = np.fromiter((c for b in blocks for c in (b["bbox"][1], b["bbox"][3])), 
+                       dtype=np.float64, count=2*len(blocks)).reshape(-1, 2)
+    return (bbox[:, 0] > pframe) & (bbox[:, 1] < pheight - pframe)
+
+
+# Characters gluing two spans together
+_LIG_CHARS = frozenset('ﬁﬂ—')
+
+
+# String checks used by get_span, written with str methods rather than regexes since they
+# run on every span of the document
+
+# Checks whether t is a non-empty run of ASCII capital letters ("[A-Z]+$")
+def _is_caps(t):
+    return t.isascii() and t.isalpha() and t.isupper()
+
+
+# Checks whether t is capital words separated by single spaces and ending with a single 
+# capital letter, e.g. "A" or "AB C" ("(([A-Z]+\s)+)?[A-Z]$")
+def _is_caps_initial(t):
+    if not _is_caps(t[-1:]):
+        return False
+    if len(t) == 1:
+        return True
+    if not t[-2].isspace():
+        return False
+    head = t[:-2]
+    words = head.split()
+    return (bool(words) and not head[0].isspace() and all(_is_caps(w) for w in words)
+            and len(head) == sum(len(w) for w in words) + len(words) - 1)
+
+
+# Checks whether t is a ligature or dash, optionally surrounded by one space ("(\s)?[ﬁﬂ—](\s)?$")
+def _is_lig_span(t):
+    if t[:1].isspace():
+        t = t[1:]
+    if len(t) > 1 and t[-1].isspace():
+        t = t[:-1]
+    return t in _LIG_CHARS
+
+
+# Returns a title lowercased and stripped of spaces and punctuation
+def _norm_title(title):
+    return _STRIP.sub('', title.lower().strip())
+
+
+# Checks whether one of two normalized titles contains the other, a missing title never matches
+def _title_match(a, b):
+    if a is None or b is None:
+        return False
+    return a in b or b in a
+
+
 class TextExtractor:
     
     def __init__(self, doc):
         self.doc = doc
         self.toc = self.get_toc()
+        # The ToC is static, its dictionary version and the position of each section are built once
+        self._dtoc = self.toc2dtoc()
+        self._toc_index = {sec: i for i, sec in enumerate(self.toc)}
+        self._parent_cache = {}
+        # Normalized font names, shared by all the spans using the same font
+        self._font_norm = {}
+        # Parsed page dicts, least recently used first
+        self._page_cache = OrderedDict()
+        # Page geometry and main text style, computed on the first extraction
+        self._info = None
+
+
+    # Returns the dict of the page at index i, parsing it only if it is not in the cache
+    def _page_dict(self, i):
+        page_dict = self._page_cache.get(i)
+        if page_dict is None:
+            page_dict = self.doc.load_page(i).get_text("dict")
+            self._page_cache[i] = page_dict
+            if len(self._page_cache) > PAGE_CACHE_SIZE:
+                self._page_cache.popitem(last=False)
+        else:
+            self._page_cache.move_to_end(i)
+        return page_dict
+
+
+    # Returns the font name cut at its first '+', the result being cached and shared between spans
+    def _norm_font(self, font):
+        norm = self._font_norm.get(font)
+        if norm is None:
+            norm = self._font_norm[font] = font.partition('+')[0]
+        return norm
 
 
     # Returns the formatted ToC (comprising the end page of each section) 
     def get_toc(self):
         toc = self.doc.get_toc()  # format: [level, title, page]
         toc_with_end = []
+        # Index of the closest following section at each level (len(toc) if none)
+        next_by_level = [len(toc)] * (max((entry[0] for entry in toc), default=0) + 1)
     
-        for i, (level, title, start_page) in enumerate(toc):
-            # Look ahead for the next section at same or higher level
-            end_page = self.doc.page_count  # default: end of document
-    
-            for j in range(i + 1, len(toc)):
-                next_level, _, next_start = toc[j]
-                if next_level <= level:
-                    end_page = toc[j][2]
-                    break
+        # Walking backwards, the next section at same or higher level is the closest one seen so far
+        for i in range(len(toc) - 1, -1, -1):
+            level, title, start_page = toc[i]
+            j = min(next_by_level[:level + 1])
+            end_page = toc[j][2] if j < len(toc) else self.doc.page_count  # default: end of document
+            next_by_level[level] = i
             title = re.sub(r'(\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007\u2008\u2009\u200a)+', ' ', 
                            re.sub(r'(\xad\xa0])+', '',re.sub(r'\r', '', title)))
             toc_with_end.append(
@@ -34,61 +155,60 @@ class TextExtractor:
                 end_page)
             )
     
+        toc_with_end.reverse()
         return toc_with_end
         
 
-    # Getting the info from PDF
+    # Getting the info from PDF, once per document
     def info_extract(self):
+        if self._info is not None:
+            return self._info
         
         # Defining page height from first page
-        pheight = doc[0].rect.height
+        pheight = self.doc[0].rect.height
         
         # Defining frame height 
         PFRAME = 50
         
         # Computing dominant text size throughout the document
-        main_size = self.get_main_size()
-        main_font = self.get_main_font()
+        main_size, main_font = self._scan_main_style()
     
-        return (pheight, PFRAME, main_size, main_font)
+        self._info = (pheight, PFRAME, main_size, main_font)
+        return self._info
 
     
-    # Returns the main text's size of a document
-    def get_main_size(self):
-        font_sizes = []
-        for page in self.doc:
-            text_dict = page.get_text("dict")
-            blocks = text_dict["blocks"]
+    # Returns the main text's size and font of a document, counted in a single pass over the spans
+    def _scan_main_style(self):
+        sizes = array.array('i')
+        fonts = Counter()
+        for i in range(self.doc.page_count):
+            # Only the first pages go through the cache, so that the scan leaves it holding the 
+            # pages the extraction starts with instead of the last ones
+            if i < PAGE_CACHE_SIZE:
+                blocks = self._page_dict(i)["blocks"]
+            else:
+                blocks = self.doc.load_page(i).get_text("dict")["blocks"]
             for block in blocks:
                 for line in block.get("lines", []):
                     for span in line.get("spans", []):
-                        if not re.match(r'[\s\t]+', span["text"]): font_sizes.append(round(span["size"]))
-        size_count = Counter(font_sizes)
-        dominant_size = size_count.most_common(2)
-        if (dominant_size[1][0] > dominant_size[0][0] and dominant_size[1][1] > dominant_size[0][0]/2):
-            main_size = round(dominant_size[1][0]) 
+                        if not _WS.match(span["text"]): 
+                            sizes.append(round(span["size"]))
+                            fonts[self._norm_font(span["font"])] += 1
+
+        # Histogram of the rounded sizes, indexed by size
+        size_count = np.bincount(np.asarray(sizes, dtype=np.int32), minlength=2)
+        # Two most common sizes, ordered by decreasing count
+        dominant_size = np.argpartition(size_count, -2)[-2:]
+        dominant_size = dominant_size[np.argsort(size_count[dominant_size])[::-1]]
+        if (size_count[dominant_size[1]] > 0 and dominant_size[1] > dominant_size[0] 
+            and size_count[dominant_size[1]] > dominant_size[0]/2):
+            main_size = int(dominant_size[1]) 
         else:
-            main_size = round(dominant_size[0][0]) 
-    
-        return main_size
-    
+            main_size = int(dominant_size[0]) 
 
-    # Returns the main text's font of a document
-    def get_main_font(self):
-        fonts = []
-        for page in self.doc:
-            text_dict = page.get_text("dict")
-            blocks = text_dict["blocks"]
-            for block in blocks:
-                for line in block.get("lines", []):
-                    for span in line.get("spans", []):
-                        if not re.match(r'[\s\t]+', span["text"]): fonts.append(span["font"])
-        font_count = Counter(fonts)
-        dominant_font = font_count.most_common(1)[0]
-        if type(dominant_font) == tuple:
-            dominant_font = dominant_font[0]
-        
-        return dominant_font
+        main_font = fonts.most_common(1)[0][0]
+    
+        return main_size, main_font
 
 
     # Returns the dictionary version of ToC
@@ -112,16 +232,22 @@ class TextExtractor:
         return cleanup(root)
 
 
-    # Returns the first parent section of secname
-    def get_parent(self, section, parent=None):
-        dtoc = self.toc2dtoc()
+    # Returns the first parent section of section
+    def get_parent(self, section):
+        section = tuple(section)
+        if section not in self._parent_cache:
+            self._parent_cache[section] = self._find_parent(section, self._dtoc)
+        return self._parent_cache[section]
+
+
+    def _find_parent(self, section, dtoc, parent=None):
         for key, value in dtoc.items():
             if key == section:
                 return parent
                 
             if isinstance(value, dict):
                 dchild = value
-                result = get_parent(section, dchild, key)
+                result = self._find_parent(section, dchild, key)
                 if result:
                     return result
         return None
@@ -131,7 +257,7 @@ class TextExtractor:
     def get_children(self, section):
         subsections=[]
         level = section[0]
-        for sec in self.toc[self.toc.index(section)+1:]:
+        for sec in self.toc[self._toc_index[tuple(section)]+1:]:
             if sec[0]>level:
                 subsections.append(sec)
             elif sec[0]==level:
@@ -142,7 +268,7 @@ class TextExtractor:
     # Returns the section following the given section
     def get_next_section(self, section):
         level = section[0]
-        for sec in self.toc[self.toc.index(section)+1:]:
+        for sec in self.toc[self._toc_index[tuple(section)]+1:]:
             if sec[0]<=level:
                 return sec
         return None
@@ -153,21 +279,20 @@ class TextExtractor:
         spans = []
         span = {}
         for s in line.get("spans", []):
-            s["font"] = re.sub(r'\+.*', '', s["font"])
-            if not re.match(r'[\s\t]+$', s["text"]):
-                s["text"] = re.sub(r'.*(\\u200[0-9a])+.*', ' ', re.sub(r'.*(\\xa[d0])+.*', '',s["text"]))
+            s["font"] = self._norm_font(s["font"])
+            if not _WS_ONLY.match(s["text"]):
                 if span == {}: 
                     span = {'text': s["text"], 
                             'font': s["font"], 
                             'size': s["size"]}
                 else: 
-                    if re.match(r"(([A-Z]+\s)+)?[A-Z]$", span["text"].strip(' ,.:?!')): 
+                    if _is_caps_initial(span["text"].strip(' ,.:?!')): 
                         span["text"] = span["text"] + s["text"] 
                         span["size"] = s["size"]  
                         span["font"] = s["font"]
                         
                     elif span["font"] != s["font"] or span["size"] != s["size"]: 
-                        if re.match(r"[A-Z]+$", s["text"]):
+                        if _is_caps(s["text"]):
                             span["text"] = span["text"] + ' ' + s["text"]
                         else:
                             spans.append(span.copy())
@@ -175,16 +300,14 @@ class TextExtractor:
                                     'font': s["font"], 
                                     'size': s["size"]}
     
-                    elif (re.match(r"(\s)?[ﬁﬂ—](\s)?$", s["text"]) 
-                          or re.match(r"[ﬁﬂ—]$", span["text"][-1])
-                         ):
+                    elif _is_lig_span(s["text"]) or span["text"][-1:] in _LIG_CHARS:
                         span["text"] = span["text"] + s["text"]
                         
                     elif (span["font"] == s["font"] and
                           span["size"] == s["size"]
                          ):
                         if (' ' in (s["text"][0], span["text"][-1]) 
-                            or (len(span["text"]) > 1 and re.match(r"^\s[A-Z]$", span["text"][-2:]))
+                            or (len(span["text"]) > 1 and span["text"][-2].isspace() and _is_caps(span["text"][-1]))
                            ):
                             span["text"] = span["text"] + s["text"] 
                         else:
@@ -193,165 +316,159 @@ class TextExtractor:
                         continue
         if span != {}: spans.append(span)
         for span in spans: 
-            span["text"] = span["text"].strip()
-            span["text"] = re.sub(r'(\\u200[0-9a])+', ' ', span["text"])
+            # Replacing ligatures and special spaces, removing soft hyphens and non-breaking spaces
+            text = span["text"].translate(_TBL)
             # Removing references
-            span["text"] = re.sub(r'(;\s)?\[\s(\d(\s,\s+)?)+\s\]', '', span["text"])
-            span["text"] = re.sub(r'(;\s)?\[\s\d+\s–\s\d+\s\]', '', span["text"])
-            # Formatting spaces surrounding commas, dots, and parentheses
-            span["text"] = re.sub(r'\(\s', '(', span["text"])
-            span["text"] = re.sub(r'\s\)', ')', span["text"])
+            text = _REFS.sub('', text)
+            # Formatting spaces surrounding parentheses
+            text = _LPAR.sub('(', text)
+            text = _RPAR.sub(')', text)
             # Removing multiple spaces (strip method fails)
-            span["text"] = re.sub(r'\s+', ' ', span["text"])
-            # Replacing the 'ﬁ' and 'ﬂ' characters with correct "fi" string
-            span["text"] = re.sub(r'ﬁ', 'fi', span["text"])
-            span["text"] = re.sub(r'ﬂ', 'fl', span["text"])
+            text = _MULTISPACE.sub(' ', text)
+            span["text"] = text.strip()
         return spans
 
 
-        # Returns the specified sections'dictionary structured text 
-        def text_extract(self, sections, num_block=0):
+    # Yields the blocks of pages start_page to end_page (1-based, inclusive) one page at a time
+    def _iter_blocks(self, start_page, end_page):
+        for i in range(start_page, min(end_page, self.doc.page_count)+1):
+            yield self._page_dict(i-1)["blocks"]
+
+
+    # Returns the specified sections'dictionary structured text 
+    def text_extract(self, sections, num_block=0):
+
+        pheight, pframe, main_size, main_font = self.info_extract()
     
-            pheight, pframe, main_size, main_font = self.info_extract(self.doc)
-            dtoc = self.toc2dtoc(self.toc)
-        
-            main_text = {}
-        
-            for section in sections:
-                start_page = section[2]
-                end_page = section[3]
-                level = section[0]
-                parent = self.get_parent(section, dtoc)
-        
-                next_section = self.get_next_section(section)
-                subsections = self.get_children(section)
-        
-                if (parent in sections) and (parent is not None):
-                    continue
-        
-                key = ""
-                value = []
-                
-                pblocks = []
-                for i in range(start_page, end_page+1):
-                    page = self.doc.load_page(i-1)
-                    pblocks.append(page.get_text("dict")["blocks"])
-        
+        main_text = {}
+        # The document format does not change from one block to the next
+        fmt = self.doc.metadata["format"].lower()
+        is_pdf = "pdf" in fmt
+        is_epub = "epub" in fmt
+        # Selected sections as hashable ToC keys, for constant-time parent lookups
+        section_set = frozenset(tuple(s) for s in sections)
+    
+        for section in sections:
+            start_page = section[2]
+            end_page = section[3]
+            level = section[0]
+            parent = self.get_parent(section)
+    
+            next_section = self.get_next_section(section)
+            subsections = self.get_children(section)
+    
+            if (parent is not None) and (parent in section_set):
+                continue
+    
+            # Titles normalized once per section rather than once per line
+            norm_self = _norm_title(section[1])
+            norm_next = _norm_title(next_section[1]) if next_section is not None else None
+            norm_sub0 = _norm_title(subsections[0][1]) if len(subsections) > 0 else None
+    
+            key = ""
+            # Text fragments of the section, joined once the section is read, and its subsections' texts
+            parts = []
+            last_char = ''
+            subtexts = []
+            
+            skip = False
+            stop = False
+            flag = False
+            for page_i, blocks in enumerate(self._iter_blocks(start_page, end_page)):
+                if stop: break
                 skip = False
-                stop = False
-                flag = False
-                for blocks in pblocks:
-                    if stop: break
-                    skip = False
-                    if pblocks.index(blocks) > 0:
-                        num_block = 0
-                    for block in blocks[num_block:]:
-                        if skip or stop: break  
-                        # Removing header and footer blocks
-                        if (("pdf" in self.doc.metadata["format"].lower() and block["bbox"][1] > pframe and block["bbox"][3] < pheight-pframe) or
-                            "epub" in self.doc.metadata["format"].lower()):
-                            for line in block.get("lines", []):
-                                inline_title = False
-                                spans = self.get_span(line)
-                                # Check if line span is empty
-                                if len(spans) > 0: 
-                                                                                            
-                                    # Detect captions
-                                    if (blocks[blocks.index(block)-1]['type'] == 1
-                                        and (spans[0]["font"] != main_font or spans[0]["size"] < main_size)
-                                       ): 
-                                        break
+                if page_i > 0:
+                    num_block = 0
+                # Header and footer filter of the whole page, EPUB pages have neither
+                body = _body_mask(blocks, pheight, pframe) if is_pdf and not is_epub else None
+                for bi, block in enumerate(blocks[num_block:], start=num_block):
+                    if skip or stop: break  
+                    lines = block.get("lines", [])
+                    # Removing header and footer blocks
+                    if is_epub or (body is not None and body[bi]):
+                        for li, line in enumerate(lines):
+                            inline_title = False
+                            spans = self.get_span(line)
+                            # Check if line span is empty
+                            if len(spans) > 0: 
+                                                                                        
+                                # Detect captions
+                                if (bi > 0 and blocks[bi-1]['type'] == 1
+                                    and (spans[0]["font"] != main_font or spans[0]["size"] < main_size)
+                                   ): 
+                                    break
+                                
+                                # Detect titles
+                                if (spans[0]["font"] != main_font or spans[0]["size"] != main_size
+                                    and li < 4
+                                   ):
+                                    norm_span = _norm_title(spans[0]['text'])
                                     
-                                    # Detect titles
-                                    if (spans[0]["font"] != main_font or spans[0]["size"] != main_size
-                                        and block.get("lines", []).index(line) < 4
-                                       ):
-                                        
-                                        # Detect current section's title
-                                        if (re.search(rf"{re.escape(re.sub(r'[ ,.:?!]', '', spans[0]['text'].lower().strip()))}", 
-                                                      re.sub(r'[ ,.:?!]', '', section[1].lower())) 
-                                            or re.search(rf"{re.escape(re.sub(r'[ ,.:?!]', '', section[1].lower()))}", 
-                                                         re.sub(r'[ ,.:?!]', '', spans[0]['text'].lower().strip()))
-                                           ):
-                                            if key == '':
-                                                key = section[1]
-                                                value = ['']
-                                                if len(spans) <= 1: continue
-                                                else: inline_title = True
-                                            else:
-                                                if re.sub(r'[ ,.:?!]', '', spans[0]['text'].lower().strip()) == re.sub(r'[ ,.:?!]', '', section[1].lower()): 
-                                                    continue
-        
-                                        # Skip subsections' text 
-                                        elif flag:
-                                            if not (re.search(rf"{re.escape(re.sub(r'[ ,.:?!]', '', spans[0]['text'].lower().strip()))}", 
-                                                              re.sub(r'[ ,.:?!]', '', next_section[1].lower())) 
-                                                    or re.search(rf"{re.escape(re.sub(r'[ ,.:?!]', '', next_section[1].lower()))}", 
-                                                                 re.sub(r'[ ,.:?!]', '', spans[0]['text'].lower().strip()))
-                                                   ):
-                                                skip = True
-                                            else:
-                                                flag = False
-                                                stop = True
-                                            break
-                                                
-                                        # Detect next section's title
-                                        elif (next_section is not None
-                                              and (re.search(rf"{re.escape(re.sub(r'[ ,.:?!]', '', spans[0]['text'].lower().strip()))}", 
-                                                             re.sub(r'[ ,.:?!]', '', next_section[1].lower())) 
-                                                   or re.search(rf"{re.escape(re.sub(r'[ ,.:?!]', '', next_section[1].lower()))}", 
-                                                                re.sub(r'[ ,.:?!]', '', spans[0]['text'].lower().strip())))
-                                              and key != ''
-                                             ):
+                                    # Detect current section's title
+                                    if _title_match(norm_span, norm_self):
+                                        if key == '':
+                                            key = section[1]
+                                            parts = []
+                                            last_char = ''
+                                            subtexts = []
+                                            if len(spans) <= 1: continue
+                                            else: inline_title = True
+                                        else:
+                                            if norm_span == norm_self: 
+                                                continue
+    
+                                    # Skip subsections' text 
+                                    elif flag:
+                                        if not _title_match(norm_span, norm_next):
+                                            skip = True
+                                        else:
+                                            flag = False
                                             stop = True
-                                            break
-        
-                                        # Detect first subsection 
-                                        elif (len(subsections)>0
-                                              and (re.search(rf"{re.escape(re.sub(r'[ ,.:?!]', '', spans[0]['text'].lower().strip()))}", 
-                                                             re.sub(r'[ ,.:?!]', '', subsections[0][1].lower())) 
-                                                   or re.search(rf"{re.escape(re.sub(r'[ ,.:?!]', '', subsections[0][1].lower()))}", 
-                                                                re.sub(r'[ ,.:?!]', '', spans[0]['text'].lower().strip())))
-                                              and key != ''
-                                             ): 
-                                            value.append(self.text_extract(subsections, blocks.index(block))) 
-                                            flag = True
-                                            break
+                                        break
                                             
-                                        # Detect bibliography or references section (in case they are not in toc)
-                                        elif spans[0]["text"].lower().strip() in ("references", "bibliography"):
-                                            stop = True
-                                            break
-                                        
-                                        # Remove footer blocks from the text
-                                        elif (re.match(r'\s?\d+\s?$', spans[0]["text"]) 
-                                              and [span["size"] < main_size for span in spans]):
-                                            skip = True
-                                            break
-                                        
-                                    #else:
-                                    if key != '': 
-                                        #if not inline_title and spans[0]["text"].lower().strip(',.:?!') in key.lower().strip(',.:?!'):
-                                        #    continue
-                                        if inline_title: spans = spans[1:]
-                                        for span in spans: 
-                                            if re.match(r'\s?\d+\s?$', span["text"]) and span["size"] < main_size:
-                                                continue
-                                            elif (len(value[0]) > 1 and re.match(r'-', value[0][-1])
-                                                 or len(value[0])==0): 
-                                                value[0] = value[0].strip() + span["text"]
-                                            else: 
-                                                value[0] = value[0].strip() + ' ' + span["text"] 
+                                    # Detect next section's title
+                                    elif (next_section is not None
+                                          and _title_match(norm_span, norm_next)
+                                          and key != ''
+                                         ):
+                                        stop = True
+                                        break
+    
+                                    # Detect first subsection 
+                                    elif (len(subsections)>0
+                                          and _title_match(norm_span, norm_sub0)
+                                          and key != ''
+                                         ): 
+                                        subtexts.append(self.text_extract(subsections, bi)) 
+                                        flag = True
+                                        break
                                         
-                        if key != "":
-                            main_text[key] = value
-                            value[0] = re.sub(r'[\xad\xa0]\s', '', value[0])
-                            value[0] = re.sub(r'\s+([.,:?!]([A-Z]))', r'\1 \2', value[0])
-                            if re.match(r'\. ', value[0]): 
-                                value[0] = value[0][2:] 
-                            if re.match(r'[a-z]+(\.)?\s?\w+', value[0]):
-                                value[0] = re.sub(r'^[a-z]+(\.)?\s?(\w+)', r'\2', value[0])
-                            
-                                
-                
-            return main_text
\ No newline at end of file
+                                    # Detect bibliography or references section (in case they are not in toc)
+                                    elif spans[0]["text"].lower().strip() in ("references", "bibliography"):
+                                        stop = True
+                                        break
+                                    
+                                    # Remove footer blocks from the text
+                                    elif (_PAGENUM.match(spans[0]["text"]) 
+                                          and [span["size"] < main_size for span in spans]):
+                                        skip = True
+                                        break
+                                    
+                                #else:
+                                if key != '': 
+                                    #if not inline_title and spans[0]["text"].lower().strip(',.:?!') in key.lower().strip(',.:?!'):
+                                    #    continue
+                                    if inline_title: spans = spans[1:]
+                                    for span in spans: 
+                                        if _PAGENUM.match(span["text"]) and span["size"] < main_size:
+                                            continue
+                                        elif not parts or last_char == '-': 
+                                            parts.append(span["text"])
+                                        else: 
+                                            parts.append(' ' + span["text"])
+                                        last_char = span["text"][-1:] or last_char
+                                    
+            if key != "":
+                main_text[key] = [_clean_section_text(''.join(parts))] + subtexts
+            
+        return main_text
\ No newline at end of file
@@ -5,23 +5,152 @@ Uses multiple heuristics to identify chapter/section headings
 """
 
 import fitz  # PyMuPDF
+import io
+import os
 import re
 import zipfile
+import functools
+from operator import attrgetter
+from array import array
+import numpy as np
 import xml.etree.ElementTree as ET
-from collections import defaultdict, Counter
+from html.parser import HTMLParser
+from collections import Counter, OrderedDict
 from dataclasses import dataclass
-from typing import List, Tuple, Optional, Dict
-import statistics
+from typing import List, Tuple, Optional, Dict, Iterable, Iterator, Union
 
-@dataclass
+# Hyperscan matches all span patterns in one DFA scan when available, re is used otherwise
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
+# Text extraction flags of the span scan: image blocks and their pixel data are skipped, 
+# ligatures are expanded so that headings match the patterns letter by letter
+SPAN_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES & ~fitz.TEXT_PRESERVE_LIGATURES
+
+# Letters a span must start with to match a roman numeral or a Chapter/Part/Section pattern, 
+# with the non-ASCII characters that re.IGNORECASE folds onto them (İ, ı, ſ)
+ROMAN_INITIALS = frozenset('IVXLCDMivxlcdm\u0130\u0131')
+HEADING_INITIALS = ROMAN_INITIALS | frozenset('PSps\u017f')
+
+# Number of extracted TOCs kept in memory by an extractor
+TOC_CACHE_SIZE = 64
+
+# Number of span classifications memoized by an extractor, running headers and footers 
+# repeating the same text on most pages
+SPAN_CACHE_SIZE = 4096
+
+# Slotted, as long documents can yield tens of thousands of candidate entries
+@dataclass(slots=True)
 class TOCEntry:
     title: str
     level: int
     page: Optional[int] = None
     position: Optional[float] = None
 
+class _HeadingParser(HTMLParser):
+    """Collect the text of h1-h6 elements, nested inline tags included"""
+    
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.entries = []
+        self._level = None
+        self._parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if len(tag) == 2 and tag[0] == 'h' and tag[1] in '123456':
+            self._level = int(tag[1])
+            self._parts = []
+
+    def handle_endtag(self, tag):
+        if self._level is not None and tag == f'h{self._level}':
+            title = ' '.join(''.join(self._parts).split())
+            if title:
+                self.entries.append(TOCEntry(title=title, level=self._level))
+            self._level = None
+
+    def handle_data(self, data):
+        if self._level is not None:
+            self._parts.append(data)
+
+
+class _NavListParser(HTMLParser):
+    """Collect the list items of <nav> elements and of lists whose class contains toc"""
+    
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        # Open nav/ol/ul/li elements as (tag, item) pairs, item being the entry of an <li>
+        self._stack = []
+        self._regions = 0
+        self._items = []
+
+    @property
+    def entries(self) -> List[TOCEntry]:
+        entries = []
+        for item in self._items:
+            # The first link of an item gives its title, its own text otherwise
+            title = ' '.join(''.join(item['link'] or item['text']).split())
+            if title:
+                entries.append(TOCEntry(title=title, level=item['level']))
+        return entries
+
+    def _current_item(self):
+        for tag, item in reversed(self._stack):
+            if tag == 'li':
+                return item
+        return None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('nav', 'ol', 'ul'):
+            is_region = tag == 'nav' or 'toc' in (dict(attrs).get('class') or '')
+            self._regions += is_region
+            self._stack.append((tag, is_region))
+        elif tag == 'li' and self._regions:
+            # Nesting level given by the number of enclosing lists
+            level = max(1, sum(1 for t, _ in self._stack if t in ('ol', 'ul')))
+            item = {'level': level, 'link': [], 'text': [], 'in_link': False, 'linked': False}
+            self._items.append(item)
+            self._stack.append(('li', item))
+        elif tag == 'a':
+            item = self._current_item()
+            if item is not None and not item['linked']:
+                item['in_link'] = True
+
+    def handle_endtag(self, tag):
+        if tag == 'a':
+            item = self._current_item()
+            if item is not None and item['in_link']:
+                item['in_link'] = False
+                item['linked'] = True
+            return
+        if tag not in ('nav', 'ol', 'ul', 'li'):
+            return
+        # Closing the element along with any element left open inside it
+        for i in range(len(self._stack) - 1, -1, -1):
+            if self._stack[i][0] == tag:
+                for t, value in self._stack[i:]:
+                    if t != 'li':
+                        self._regions -= value
+                del self._stack[i:]
+                break
+
+    def handle_data(self, data):
+        item = self._current_item()
+        if item is None:
+            return
+        if item['in_link']:
+            item['link'].append(data)
+        elif not item['linked']:
+            item['text'].append(data)
+
+
 class TOCExtractor:
     def __init__(self):
+        # LRU cache of extracted TOCs keyed by (kind, path, mtime, size)
+        self._cache: OrderedDict = OrderedDict()
+        self._classify = functools.lru_cache(maxsize=SPAN_CACHE_SIZE)(self._classify_span)
+        
         # Common patterns for chapter/section titles
         self.heading_patterns = [
             r'^(Chapter|CHAPTER)\s+(\d+|[IVXLCDM]+)[\s\.\-:]*(.*)$',
@@ -39,8 +168,62 @@ class TOCExtractor:
             'summary', 'overview', 'background', 'methodology', 'results',
             'discussion', 'acknowledgments', 'preface', 'foreword'
         }
+        # All keywords in one alternation, longest first, searched in a single pass over the lowercased text
+        self._kw_re = re.compile("|".join(map(re.escape, sorted(self.heading_keywords, key=len, reverse=True))))
+        
+        # Compiled once, the heading patterns are matched against every span of the document
+        self._heading_union = re.compile(
+            "|".join(f"(?P<p{i}>{p})" for i, p in enumerate(self.heading_patterns)), re.IGNORECASE)
+        self._numeric_re = re.compile(r'^\d+(\.\d+)*[\.\)\s]')
+        self._roman_re = re.compile(r'^[IVXLCDM]+[\.\)\s]', re.IGNORECASE)
+        self._level_part_re = re.compile(r'^(Chapter|CHAPTER|Part|PART)')
+        self._level3_re = re.compile(r'^\d+\.\d+\.\d+')
+        self._level2_re = re.compile(r'^\d+\.\d+')
+        self._level1_re = re.compile(r'^\d+[\.\)]')
+        
+        # Score of every combination of the 8 heading features, most significant bit first: 
+        # large font, bold, italic, heading pattern, keyword, numeric start, roman start, all caps
+        weights = (2, 2, 1, 3, 2, 2, 2, 1)
+        self._score_lut = bytes(sum(w for w, b in zip(weights, format(i, '08b')) if b == '1') for i in range(256))
+        
+        # Heading patterns get ids 0..n-1, followed by the numeric and roman patterns
+        self._hs_db = None
+        if hyperscan is not None:
+            expressions = self.heading_patterns + [self._numeric_re.pattern, self._roman_re.pattern]
+            self._numeric_bit = 1 << len(self.heading_patterns)
+            self._roman_bit = self._numeric_bit << 1
+            self._hs_db = hyperscan.Database()
+            self._hs_db.compile(
+                expressions=[e.encode('utf-8') for e in expressions],
+                ids=list(range(len(expressions))),
+                flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH | hyperscan.HS_FLAG_UTF8] * len(expressions)
+            )
+            self._hs_scratch = hyperscan.Scratch(self._hs_db)
+
+    def _cached(self, kind: str, path: str, extract) -> List[TOCEntry]:
+        """Return the TOC of a file from the cache, extracting it if the file is new or was modified"""
+        st = os.stat(path)
+        key = (kind, os.path.abspath(path), st.st_mtime_ns, st.st_size)
+        entries = self._cache.get(key)
+        if entries is None:
+            entries = extract(path)
+            self._cache[key] = entries
+            if len(self._cache) > TOC_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        # Copying the list so that callers cannot alter the cached one
+        return list(entries)
 
     def extract_toc_from_pdf(self, pdf_path: str) -> List[TOCEntry]:
+        """Extract TOC from PDF using multiple strategies"""
+        return self._cached('pdf', pdf_path, self._extract_toc_from_pdf)
+
+    def extract_toc_from_epub(self, epub_path: str) -> List[TOCEntry]:
+        """Extract TOC from EPUB"""
+        return self._cached('epub', epub_path, self._extract_toc_from_epub)
+
+    def _extract_toc_from_pdf(self, pdf_path: str) -> List[TOCEntry]:
         """Extract TOC from PDF using multiple strategies"""
         doc = fitz.open(pdf_path)
         
@@ -51,34 +234,41 @@ class TOCExtractor:
             return built_in_toc
         
         # Use text analysis approach
-        toc_entries = []
-        
-        # Analyze font characteristics across document
-        font_stats = self._analyze_font_characteristics(doc)
+        # Analyze font characteristics across document, keeping the sampled spans so that 
+        # their pages are not parsed a second time
+        sample_pages = min(20, len(doc))
+        sample_spans = list(self._iter_spans(doc, 0, sample_pages))
+        font_stats = self._analyze_font_characteristics(sample_spans)
         
-        # Extract potential headings
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            blocks = page.get_text("dict")["blocks"]
-            
-            for block in blocks:
-                if "lines" in block:
-                    for line in block["lines"]:
-                        for span in line["spans"]:
-                            text = span["text"].strip()
-                            if self._is_potential_heading(text, span, font_stats):
-                                level = self._determine_heading_level(text, span, font_stats)
-                                toc_entries.append(TOCEntry(
-                                    title=text,
-                                    level=level,
-                                    page=page_num + 1,
-                                    position=span["bbox"][1]  # y-coordinate
-                                ))
+        # Extract potential headings, deduplicated by (lowercased title, level) as they are found
+        toc_entries = self._find_headings(sample_spans, font_stats)
+        self._find_headings(self._iter_spans(doc, sample_pages, len(doc)), font_stats, toc_entries)
         
         doc.close()
-        return self._clean_and_sort_toc(toc_entries)
+        return sorted(toc_entries.values(), key=attrgetter('page', 'position'))
 
-    def extract_toc_from_epub(self, epub_path: str) -> List[TOCEntry]:
+    def _find_headings(self, spans: Iterable[Tuple], font_stats: dict, 
+                       entries: Optional[Dict[tuple, TOCEntry]] = None) -> Dict[tuple, TOCEntry]:
+        """Extract potential headings from (page_num, text, size, font, flags, y) spans, keyed by (lowercased title, level)"""
+        if entries is None:
+            entries = {}
+        median_size = font_stats.get('median_size', 12)
+        large_sizes = tuple(font_stats.get('large_sizes', ()))
+        for page_num, text, size, font, flags, y in spans:
+            text = text.strip()
+            level = self._classify(text, size, flags, median_size, large_sizes)
+            if level is not None:
+                key = (text.lower(), level)
+                if key not in entries:
+                    entries[key] = TOCEntry(
+                        title=text,
+                        level=level,
+                        page=page_num + 1,
+                        position=y  # y-coordinate
+                    )
+        return entries
+
+    def _extract_toc_from_epub(self, epub_path: str) -> List[TOCEntry]:
         """Extract TOC from EPUB"""
         toc_entries = []
         
@@ -93,14 +283,33 @@ class TOCExtractor:
             
             for html_file in html_files:
                 try:
-                    content = epub.read(html_file).decode('utf-8', errors='ignore')
-                    headings = self._extract_headings_from_html(content)
+                    with self._open_epub_text(epub, html_file) as stream:
+                        headings = self._extract_headings_from_html(stream)
                     toc_entries.extend(headings)
                 except Exception:
                     continue
         
         return self._clean_and_sort_toc(toc_entries)
 
+    def _read_epub_text(self, epub: zipfile.ZipFile, name: str) -> str:
+        """Decode a file of the EPUB while it is inflated, without buffering its compressed and raw bytes"""
+        with self._open_epub_text(epub, name) as stream:
+            return stream.read()
+
+    def _open_epub_text(self, epub: zipfile.ZipFile, name: str) -> io.TextIOWrapper:
+        """Open a file of the EPUB as a text stream decoded while it is inflated"""
+        return io.TextIOWrapper(epub.open(name), encoding='utf-8', errors='ignore', newline='')
+
+    def _feed_html(self, parser: HTMLParser, source: Union[str, io.TextIOBase]) -> HTMLParser:
+        """Feed a string or, chunk by chunk, a text stream to an HTML parser"""
+        if isinstance(source, str):
+            parser.feed(source)
+        else:
+            for chunk in iter(lambda: source.read(1 << 16), ''):
+                parser.feed(chunk)
+        parser.close()
+        return parser
+
     def _extract_builtin_toc(self, doc) -> List[TOCEntry]:
         """Extract built-in TOC if available"""
         toc = doc.get_toc()
@@ -114,107 +323,103 @@ class TOCExtractor:
         
         return entries
 
-    def _analyze_font_characteristics(self, doc) -> Dict:
-        """Analyze font sizes and styles across the document"""
-        font_info = defaultdict(list)
-        font_sizes = []
-        
-        # Sample first 20 pages for font analysis
-        sample_pages = min(20, len(doc))
-        
-        for page_num in range(sample_pages):
-            page = doc[page_num]
-            blocks = page.get_text("dict")["blocks"]
-            
-            for block in blocks:
-                if "lines" in block:
-                    for line in block["lines"]:
-                        for span in line["spans"]:
-                            size = span["size"]
-                            font = span["font"]
-                            flags = span["flags"]
-                            
-                            font_sizes.append(size)
-                            font_info[size].append({
-                                'font': font,
-                                'flags': flags,
-                                'text': span["text"].strip()
-                            })
+    def _iter_spans(self, doc, start: int, stop: int) -> Iterator[Tuple[int, str, float, str, int, float]]:
+        """Yield (page_num, text, size, font, flags, y) for every span of pages [start, stop), parsing each page once"""
+        for page_num in range(start, stop):
+            blocks = doc[page_num].get_text("dict", flags=SPAN_FLAGS)["blocks"]
+            # Flattening the page once, then walking a single list of spans
+            spans = [span for block in blocks for line in block.get("lines", ()) for span in line["spans"]]
+            for span in spans:
+                yield page_num, span["text"], span["size"], span["font"], span["flags"], span["bbox"][1]
+
+    def _analyze_font_characteristics(self, spans: Iterable[Tuple]) -> Dict:
+        """Analyze font sizes and styles across the sampled spans"""
+        font_sizes = array('d', (span[2] for span in spans))
         
         # Determine likely heading font sizes
         if font_sizes:
-            font_sizes.sort(reverse=True)
-            unique_sizes = sorted(list(set(font_sizes)), reverse=True)
+            sizes = np.frombuffer(font_sizes, dtype=np.float64)
+            unique_sizes = np.unique(sizes)[::-1].tolist()
             
             return {
                 'sizes': unique_sizes,
-                'median_size': statistics.median(font_sizes),
-                'large_sizes': unique_sizes[:3] if len(unique_sizes) >= 3 else unique_sizes,
-                'font_info': dict(font_info)
+                'median_size': float(np.median(sizes)),
+                'large_sizes': unique_sizes[:3] if len(unique_sizes) >= 3 else unique_sizes
             }
         
-        return {'sizes': [], 'median_size': 12, 'large_sizes': [], 'font_info': {}}
+        return {'sizes': [], 'median_size': 12, 'large_sizes': []}
+
+    def _classify_span(self, text: str, size: float, flags: int, median_size: float, 
+                       large_sizes: Tuple[float, ...]) -> Optional[int]:
+        """Return the heading level of a span, None if it is not a heading (hashable arguments for memoization)"""
+        font_stats = {'median_size': median_size, 'large_sizes': large_sizes}
+        if not self._is_potential_heading(text, size, flags, font_stats):
+            return None
+        return self._determine_heading_level(text, size, font_stats)
+
+    def _match_patterns(self, text: str) -> Tuple[bool, bool, bool]:
+        """Return whether text matches a heading pattern, starts with a number and starts with a roman numeral"""
+        # Every pattern starts with a digit or one of a few letters, which rules out most body text
+        # without running any of them
+        c0 = text[:1]
+        is_digit = c0.isdecimal()
+        if not is_digit and c0 not in HEADING_INITIALS:
+            return False, False, False
+        
+        # The Hyperscan database folds case and classes \d and \s as ASCII only, and its \s leaves 
+        # out the \x1c-\x1f separators, so non-ASCII or non-printable text goes through re so that 
+        # the results do not depend on the optional package
+        if self._hs_db is None or not (text.isascii() and text.isprintable()):
+            return (self._heading_union.match(text) is not None,
+                    is_digit and self._numeric_re.match(text) is not None,
+                    c0 in ROMAN_INITIALS and self._roman_re.match(text) is not None)
+        
+        # One scan sets the bit of every matching pattern
+        mask = [0]
+        def on_match(pattern_id, start, end, flags, context):
+            context[0] |= 1 << pattern_id
+        self._hs_db.scan(text.encode('utf-8'), match_event_handler=on_match, context=mask, scratch=self._hs_scratch)
+        mask = mask[0]
+        return (bool(mask & (self._numeric_bit - 1)),
+                bool(mask & self._numeric_bit),
+                bool(mask & self._roman_bit))
 
-    def _is_potential_heading(self, text: str, span: dict, font_stats: dict) -> bool:
+    def _is_potential_heading(self, text: str, size: float, flags: int, font_stats: dict) -> bool:
         """Determine if text is likely a heading"""
-        if not text or len(text) < 3:
+        n = len(text)
+        if n < 3:
             return False
         
         # Check if it's too long (likely body text)
-        if len(text) > 200:
+        if n > 200:
             return False
         
+        # Pattern matching, all heading, numeric (like "1.2.3") and roman numeral patterns at once
+        pattern_match, numeric_start, roman_start = self._match_patterns(text)
+        
         # Font size check
-        size = span["size"]
         if size <= font_stats.get('median_size', 12):
             # Only consider smaller fonts if they match patterns
-            if not any(re.match(pattern, text, re.IGNORECASE) for pattern in self.heading_patterns):
+            if not pattern_match:
                 return False
         
         # Bold or italic text is more likely to be a heading
-        flags = span["flags"]
-        is_bold = flags & 2**4  # Bold flag
-        is_italic = flags & 2**1  # Italic flag
-        
-        # Pattern matching
-        pattern_match = any(re.match(pattern, text, re.IGNORECASE) for pattern in self.heading_patterns)
+        is_bold = (flags >> 4) & 1  # Bold flag
+        is_italic = (flags >> 1) & 1  # Italic flag
         
         # Keyword matching
-        keyword_match = any(keyword in text.lower() for keyword in self.heading_keywords)
-        
-        # Numeric patterns (like "1.2.3")
-        numeric_start = re.match(r'^\d+(\.\d+)*[\.\)\s]', text)
-        
-        # Roman numeral patterns
-        roman_start = re.match(r'^[IVXLCDM]+[\.\)\s]', text, re.IGNORECASE)
-        
-        # All caps (but not too long)
-        is_caps = text.isupper() and len(text) < 50
-        
-        # Scoring system
-        score = 0
-        if size > font_stats.get('median_size', 12):
-            score += 2
-        if is_bold:
-            score += 2
-        if is_italic:
-            score += 1
-        if pattern_match:
-            score += 3
-        if keyword_match:
-            score += 2
-        if numeric_start:
-            score += 2
-        if roman_start:
-            score += 2
-        if is_caps:
-            score += 1
-        
-        return score >= 3
-
-    def _determine_heading_level(self, text: str, span: dict, font_stats: dict) -> int:
+        keyword_match = self._kw_re.search(text.lower()) is not None
+        
+        # All caps (but not too long), the length being checked first so long body text is never scanned
+        is_caps = n < 50 and text.isupper()
+        
+        # Scoring system, the features are packed into one byte indexing the score table
+        bits = ((size > font_stats.get('median_size', 12)) << 7 | is_bold << 6 | is_italic << 5 
+                | pattern_match << 4 | keyword_match << 3 | numeric_start << 2 | roman_start << 1 | is_caps)
+        return self._score_lut[bits] >= 3
+
+    def _determine_heading_level(self, text: str, size: float, font_stats: dict) -> int:
         """Determine the hierarchical level of a heading"""
-        size = span["size"]
         large_sizes = font_stats.get('large_sizes', [])
         
         # Level based on font size
@@ -231,13 +436,13 @@ class TOCExtractor:
             level = 2
         
         # Adjust based on content patterns
-        if re.match(r'^(Chapter|CHAPTER|Part|PART)', text):
+        if self._level_part_re.match(text):
             level = min(level, 1)
-        elif re.match(r'^\d+\.\d+\.\d+', text):  # Like 1.2.3
+        elif self._level3_re.match(text):  # Like 1.2.3
             level = max(level, 3)
-        elif re.match(r'^\d+\.\d+', text):  # Like 1.2
+        elif self._level2_re.match(text):  # Like 1.2
             level = max(level, 2)
-        elif re.match(r'^\d+[\.\)]', text):  # Like 1. or 1)
+        elif self._level1_re.match(text):  # Like 1. or 1)
             level = max(level, 1)
         
         return max(1, min(level, 6))  # Keep between 1-6
@@ -253,7 +458,7 @@ class TOCExtractor:
         
         for nav_file in nav_files:
             try:
-                content = epub.read(nav_file).decode('utf-8', errors='ignore')
+                content = self._read_epub_text(epub, nav_file)
                 
                 if nav_file.endswith('.ncx'):
                     return self._parse_ncx_file(content)
@@ -267,77 +472,33 @@ class TOCExtractor:
     def _parse_ncx_file(self, content: str) -> List[TOCEntry]:
         """Parse NCX navigation file"""
         entries = []
+        
+        def walk(node, level):
+            # Namespace wildcards match the NCX elements whatever their namespace, the level 
+            # being given by the depth of the walk as ElementTree has no ancestor axis
+            for nav_point in node.iterfind('{*}navPoint'):
+                text_elem = nav_point.find('{*}navLabel/{*}text')
+                if text_elem is not None and text_elem.text:
+                    entries.append(TOCEntry(title=text_elem.text.strip(), level=level))
+                walk(nav_point, level + 1)
+        
         try:
-            # Remove namespace declarations for simpler parsing
-            content = re.sub(r'xmlns[^=]*="[^"]*"', '', content)
             root = ET.fromstring(content)
-            
-            nav_points = root.findall('.//navPoint')
-            for nav_point in nav_points:
-                play_order = nav_point.get('playOrder', '0')
-                text_elem = nav_point.find('.//text')
-                if text_elem is not None:
-                    title = text_elem.text
-                    level = len(nav_point.findall('./ancestor::navPoint')) + 1
-                    entries.append(TOCEntry(title=title, level=level))
+            nav_map = root.find('{*}navMap')
+            walk(nav_map if nav_map is not None else root, 1)
         except Exception:
             pass
         
         return entries
 
-    def _parse_nav_html(self, content: str) -> List[TOCEntry]:
+    def _parse_nav_html(self, content: Union[str, io.TextIOBase]) -> List[TOCEntry]:
         """Parse HTML navigation file"""
-        entries = []
-        
         # Look for nav elements or lists that might contain TOC
-        nav_patterns = [
-            r'<nav[^>]*>(.*?)</nav>',
-            r'<ol[^>]*class="[^"]*toc[^"]*"[^>]*>(.*?)</ol>',
-            r'<ul[^>]*class="[^"]*toc[^"]*"[^>]*>(.*?)</ul>'
-        ]
-        
-        for pattern in nav_patterns:
-            matches = re.findall(pattern, content, re.DOTALL | re.IGNORECASE)
-            for match in matches:
-                entries.extend(self._extract_list_items(match))
-        
-        return entries
+        return self._feed_html(_NavListParser(), content).entries
 
-    def _extract_list_items(self, content: str) -> List[TOCEntry]:
-        """Extract TOC entries from HTML list items"""
-        entries = []
-        
-        # Find all list items
-        li_pattern = r'<li[^>]*>(.*?)</li>'
-        items = re.findall(li_pattern, content, re.DOTALL | re.IGNORECASE)
-        
-        for item in items:
-            # Extract text from links or plain text
-            text_match = re.search(r'<a[^>]*>([^<]+)</a>|([^<]+)', item)
-            if text_match:
-                title = (text_match.group(1) or text_match.group(2)).strip()
-                if title:
-                    # Determine nesting level by counting parent lists
-                    level = item.count('<ol') + item.count('<ul') + 1
-                    entries.append(TOCEntry(title=title, level=level))
-        
-        return entries
-
-    def _extract_headings_from_html(self, content: str) -> List[TOCEntry]:
+    def _extract_headings_from_html(self, content: Union[str, io.TextIOBase]) -> List[TOCEntry]:
         """Extract headings from HTML content"""
-        entries = []
-        
-        # Find all heading tags
-        heading_pattern = r'<h([1-6])[^>]*>([^<]+)</h[1-6]>'
-        matches = re.findall(heading_pattern, content, re.IGNORECASE)
-        
-        for level_str, title in matches:
-            level = int(level_str)
-            title = re.sub(r'<[^>]+>', '', title).strip()  # Remove any nested tags
-            if title:
-                entries.append(TOCEntry(title=title, level=level))
-        
-        return entries
+        return self._feed_html(_HeadingParser(), content).entries
 
     def _clean_and_sort_toc(self, entries: List[TOCEntry]) -> List[TOCEntry]:
         """Clean up and sort TOC entries"""
@@ -11,26 +11,60 @@
 # a PDF file, and writing the output MD file containing the summary, key concepts and
 # questions for each section of the text (if any).
 
+import io
 import os
 import re
-from collections import Counter
 import json
+import contextlib
+from dataclasses import dataclass
+import numpy as np
 import pymupdf
 
+# orjson is used to serialize the cache when available
+try:
+    import orjson
+
+    def _dumps(data):
+        return orjson.dumps(data)
+except ImportError:
+    def _dumps(data):
+        return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+# Precompiled patterns used when extracting and formatting the text
+_FIG_RE = re.compile(r'Fig(ure)?\.(\s)?(\d+)?(\w+)?(\s+)?:')
+_TABLE_RE = re.compile(r'Table(\s)?(\d+)?(\w+)?(\s+)?:')
+# Reference lists ("[ 1 , 2 ]") and ranges ("[ 1 – 3 ]")
+_REF_RE = re.compile(r'(?:;\s)?\[\s(?:\d+(?:\s,\s+)?)+\s\]|(?:;\s)?\[\s\d+\s–\s\d+\s\]')
+_COMMA_SPACE_RE = re.compile(r'\s,\s')
+_DOT_SPACE_RE = re.compile(r'\s\.\s')
+_LPAREN_SPACE_RE = re.compile(r'\(\s')
+_RPAREN_SPACE_RE = re.compile(r'\s\)')
+_WS_RE = re.compile(r'\s+')
+# Replacing the 'ﬁ' and 'ﬂ' characters with correct "fi" and "fl" strings
+_LIGATURE_TABLE = str.maketrans({'ﬁ': 'fi', 'ﬂ': 'fl'})
+_LIGATURES = frozenset(('ﬁ', 'ﬂ'))
+# Characters after which the next span is glued without a space
+_REPAIR_CHARS = frozenset(('-', 'ﬁ', 'ﬂ'))
+_SUMMARY_HDR = re.compile(r'(1\.[\s])?Summary:')
+_KEY_HDR = re.compile(r'(2\.[\s])?Key Concepts(/Facts)?(\:)?\n(\n)?')
+_NUM_HDR = re.compile(r'\d+\.\s')
+_Q_RE = re.compile(r"Q:\s.*?(?=\nA:|\Z)", re.DOTALL)
+_A_RE = re.compile(r"A:\s.*?(?=\n+Q:|\Z)", re.DOTALL)
+
 
 def get_toc(doc):
     toc = doc.get_toc()  # format: [level, title, page]
     toc_with_end = []
+    # Index of the closest following section at each level (len(toc) if none)
+    next_by_level = [len(toc)] * (max((entry[0] for entry in toc), default=0) + 1)
 
-    for i, (level, title, start_page) in enumerate(toc):
-        # Look ahead for the next section at same or higher level
-        end_page = doc.page_count  # default: end of document
-
-        for j in range(i + 1, len(toc)):
-            next_level, _, next_start = toc[j]
-            if next_level <= level:
-                end_page = toc[j][2]
-                break
+    # Walking backwards, the next section at same or higher level is the closest one seen so far
+    for i in range(len(toc) - 1, -1, -1):
+        level, title, start_page = toc[i]
+        j = min(next_by_level[:level + 1])
+        end_page = toc[j][2] if j < len(toc) else doc.page_count  # default: end of document
+        next_by_level[level] = i
 
         toc_with_end.append([
             level,
@@ -39,48 +73,76 @@ def get_toc(doc):
             end_page
         ])
 
+    toc_with_end.reverse()
     return toc_with_end
     
 
-# Getting the info from PDF
-def info_extract(doc):
-    from .logger import logger
-    logger.info(f"--- PDF metadata: {doc.metadata}")
-    # Get Table of Contents
-    toc = get_toc(doc)
-    logger.info(f"--- Table of Contents: {toc}")
-    sec_names = [toc[i][1].lower() for i in range(len(toc))]
-    
+# Returns the blocks of every page, parsed once per document
+def get_page_blocks(doc):
+    return [page.get_text("dict")["blocks"] for page in doc]
 
+
+# Returns the page and frame heights used to filter out headers and footers
+def get_page_geometry(doc):
     # Defining page height from first page
     pheight = doc[0].rect.height
-    logger.info(f"--- Page height: {pheight}")
     # Defining frame height 
     pframe = 50
-    
-    # Computing dominant text size throughout the document
-    main_font = get_main_font(doc)
-    logger.info(f"--- Main font size is {main_font}")
 
-    return (toc, pheight, pframe, main_font)
+    return (pheight, pframe)
 
 
-# Function returning the main text's font of a document
-def get_main_font(doc):
-    font_sizes = []
-    for page in doc:
-        text_dict = page.get_text("dict")
-        blocks = text_dict["blocks"]
-        for block in blocks:
-            for line in block.get("lines", []):
-                for span in line.get("spans", []):
-                    font_sizes.append(span["size"])
-    font_count = Counter(font_sizes)
-    dominant_fonts = font_count.most_common(2)
-    if (dominant_fonts[1][0] > dominant_fonts[0][0] and dominant_fonts[1][1] > dominant_fonts[0][0]/2):
-        main_font = round(dominant_fonts[1][0]) 
+# Document-level info shared by the extraction steps
+@dataclass
+class PDFInfo:
+    toc: list
+    pheight: float
+    pframe: int
+    main_font: int
+    pblocks: list
+
+
+# Getting the info from PDF
+def info_extract(doc, pblocks=None):
+    from .logger import logger
+    logger.info("--- PDF metadata: %s", doc.metadata)
+
+    if pblocks is None:
+        pblocks = get_page_blocks(doc)
+
+    # Get Table of Contents
+    toc = get_toc(doc)
+    logger.info("--- Table of Contents: %s", toc)
+    
+    pheight, pframe = get_page_geometry(doc)
+    logger.info("--- Page height: %s", pheight)
+    
+    # Computing dominant text size throughout the document
+    main_font = get_main_font_from_blocks(pblocks)
+    logger.info("--- Main font size is %s", main_font)
+
+    return PDFInfo(toc=toc,
+                   pheight=pheight,
+                   pframe=pframe,
+                   main_font=main_font,
+                   pblocks=pblocks)
+
+
+# Function returning the main text's font of a document from its already parsed page blocks
+def get_main_font_from_blocks(pblocks):
+    font_sizes = np.fromiter((span["size"] for blocks in pblocks for block in blocks 
+                              for line in block.get("lines", []) for span in line.get("spans", [])), 
+                             dtype=np.float32)
+    # Histogram of the rounded sizes, indexed by size
+    font_count = np.bincount(np.rint(font_sizes).astype(np.int32), minlength=2)
+    # Two most common sizes, ordered by decreasing count
+    dominant_fonts = np.argpartition(font_count, -2)[-2:]
+    dominant_fonts = dominant_fonts[np.argsort(font_count[dominant_fonts])[::-1]]
+    if (font_count[dominant_fonts[1]] > 0 and dominant_fonts[1] > dominant_fonts[0] 
+        and font_count[dominant_fonts[1]] > dominant_fonts[0]/2):
+        main_font = int(dominant_fonts[1]) 
     else:
-        main_font = round(dominant_fonts[0][0]) 
+        main_font = int(dominant_fonts[0]) 
 
     return main_font
 
@@ -93,7 +155,7 @@ def tocL2tocD(toc_list):
         current_dict = {}
         while stack and level <= stack[-1][0]:
             stack.pop()
-        stack[-1][1][(level, title, startpage, endpage)] = {"_page": page, "_sub": current_dict}
+        stack[-1][1][(level, title, startpage, endpage)] = {"_page": (startpage, endpage), "_sub": current_dict}
         stack.append((level, current_dict))
 
     def cleanup(d):
@@ -121,76 +183,83 @@ def find_parent(secname, toc_dict, parent=None):
     return None
     
 
+# Function cleaning up the raw text accumulated for a section
+def clean_text(value):
+    # Removing references
+    value = _REF_RE.sub('', value)
+    # Formatting spaces surrounding commas, dots, and parentheses
+    value = value.strip()
+    value = _COMMA_SPACE_RE.sub(', ', value)
+    value = _DOT_SPACE_RE.sub('. ', value)
+    value = _LPAREN_SPACE_RE.sub('(', value)
+    value = _RPAREN_SPACE_RE.sub(')', value)
+    # Removing multiple spaces (strip method fails)
+    value = _WS_RE.sub(' ', value).strip()
+
+    return value
+
+
 # Function extracting and structuring the text from PDF
 def text_extract(doc, sections):
     from .logger import logger
     logger.info("-- Starting text extraction")
-    _, pheight, pframe, main_font = info_extract(doc)
-    pblocks = [page.get_text("dict")["blocks"] for page in doc]
+    # Parsing every page once, the blocks are shared with the font analysis
+    info = info_extract(doc)
+    pheight, pframe, main_font = info.pheight, info.pframe, info.main_font
+
+    # Lowercased titles of the selected sections (ToC entries are [level, title, start, end])
+    section_names = frozenset(s[0].lower() if isinstance(s[0], str) else s[1].lower() for s in sections)
+    has_references = "references" in section_names
 
     main_text = {}
     key = ""
-    value = ""
+    # Text fragments of the current section, joined once the section ends
+    value_parts = []
+    last_char = ""
     
-    for blocks in pblocks:
+    for blocks in info.pblocks:
         for block in blocks:
             # Removing header and footer blocks
             if block["bbox"][1] > pframe and block["bbox"][3] < pheight-pframe:
                 for line in block.get("lines", []):
+                    spans = line.get("spans", [])
+                    first = spans[0]["text"] if spans else ""
+                    first_text = first.lower()
                     # Get section titles as dict keys
-                    if line.get("spans", [])[0]["text"].lower() in [section[0] for section in sections]: 
-                        key = line.get("spans", [])[0]["text"].lower()
-                        value = ""
+                    if first_text in section_names: 
+                        if key != "" and value_parts:
+                            main_text[key] = clean_text(''.join(value_parts))
+                        key = first_text
+                        value_parts = []
                         continue
                     # If the references title is not included in the toc but still exists
-                    elif (any([section[0].lower() == "references" for section in sections]) == False and
-                             line.get("spans", [])[0]["text"].lower() == "references"):  
+                    elif not has_references and first_text == "references":  
+                        if key != "" and value_parts:
+                            main_text[key] = clean_text(''.join(value_parts))
                         key = "references"
-                        value = ""
+                        value_parts = []
                         continue
                     # Excluding figure and table captions
-                    elif (re.match(r'Fig(ure)?\.(\s)?(\d+)?(\w+)?(\s+)?:', line.get("spans", [])[0]["text"]) or 
-                          re.match(r'Table(\s)?(\d+)?(\w+)?(\s+)?:', line.get("spans", [])[0]["text"])):
+                    elif _FIG_RE.match(first) or _TABLE_RE.match(first):
                         break
                     # Get the block's text as dict value based on the font size
-                    for span in line.get("spans", []):
+                    for span in spans:
                         # Introducing a tolerance of font size of 0.5 for small variations in the text body
-                        if ((round(span["size"]) == main_font and key != "materials and methods")  
-                            and key != ""):
-                            text = span["text"]
-                            # Repairing lines
-                            if (len(value) > 1 and (value[-1] == "-" or value[-1] == "ﬁ" or value[-1] == 'ﬂ') 
-                                or (text == 'ﬁ' or text == 'ﬂ')):
-                                value = value + text   
-                            else: 
-                                value = value + ' ' + text 
                         # Text in an article "Materials and Methods" section can have a smaller font size
-                        if (round(span["size"]) >= main_font-1 and round(span["size"]) <= main_font 
-                             and key == "materials and methods"):
+                        if (key != "" and 
+                            (round(span["size"]) == main_font and key != "materials and methods"
+                             or (round(span["size"]) >= main_font-1 and round(span["size"]) <= main_font 
+                                 and key == "materials and methods"))):
                             text = span["text"]
                             # Repairing lines
-                            if (len(value) > 1 and (value[-1] == "-" or value[-1] == "ﬁ" or value[-1] == 'ﬂ') 
-                                or (text == 'ﬁ' or text == 'ﬂ')):
-                                value = value + text   
+                            if (value_parts and last_char in _REPAIR_CHARS) or text in _LIGATURES:
+                                value_parts.append(text.translate(_LIGATURE_TABLE))
                             else: 
-                                value = value + ' ' + text 
-                            
-            if (key != "" and value != ""):
-                # Removing references
-                value = re.sub(r'(;\s)?\[\s(\d(\s,\s+)?)+\s\]', '', value.strip())
-                value = re.sub(r'(;\s)?\[\s\d+\s–\s\d+\s\]', '', value.strip())
-                # Formatting spaces surrounding commas, dots, and parentheses
-                value = re.sub(r'\s,\s', ', ', value.strip())
-                value = re.sub(r'\s\.\s', '. ', value.strip())
-                value = re.sub(r'\(\s', '(', value.strip())
-                value = re.sub(r'\s\)', ')', value.strip())
-                # Removing multiple spaces (strip method fails)
-                value = re.sub(r'\s+', ' ', value.strip())
-                # Replacing the 'ﬁ' and 'ﬂ' characters with correct "fi" string
-                value = re.sub(r'ﬁ', 'fi', value.strip())
-                value = re.sub(r'ﬂ', 'fl', value.strip())
-                
-                main_text[key] = value
+                                value_parts.append(' ' + text.translate(_LIGATURE_TABLE))
+                            last_char = text[-1] if text else last_char
+
+    if key != "" and value_parts:
+        main_text[key] = clean_text(''.join(value_parts))
     
     logger.info("-- Text extracted and structured")
     
@@ -214,33 +283,37 @@ def write_markdown(title, sum_dict, q_dict, output_folder):
     from .logger import logger
     logger.info("-- Generating MD file")
     output_path = output_folder + f"/{title.replace(' ', '_')}.md"
+    # Building the whole document in memory and writing it to disk at once
+    buf = io.StringIO()
+    buf.write(f"# {title}\n\n\n")
+    numbered_answers = []
+    for i, key in enumerate(sum_dict.keys(), start=1):
+        buf.write(f"## {i}. {key.capitalize()}\n")
+        summary = _SUMMARY_HDR.sub('', sum_dict[key])
+        summary = _KEY_HDR.sub('### Key concepts\n', summary)
+        summary = _NUM_HDR.sub('- ', summary)
+        buf.write(summary.strip() + "\n\n")
+        
+        # Writing questions
+        buf.write("### Questions\n") 
+        # Extract questions and answers using regex
+        questions = _Q_RE.findall(q_dict[key])
+        answers = _A_RE.findall(q_dict[key])
+        # Reformat with Q1:/A1:
+        numbered_questions = [f"- **Q{i}:** {q.strip()[2:].strip()}" for i, q in enumerate(questions, start=1)]
+        numbered_answers.append([f"- **A{i}:** {a.strip()[2:].strip()}" for i, a in enumerate(answers, start=1)])
+        buf.write("\n".join(numbered_questions))
+        buf.write("\n\n\n")
+
+    # Writing answers
+    buf.write("## Answers\n")
+    for i, key in enumerate(sum_dict.keys(), start=1):
+        buf.write(f"{i}. {key.capitalize()}\n")
+        buf.write("\n".join(numbered_answers[i-1]))
+        buf.write("\n\n")
+
     with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(f"# {title}\n\n\n")
-        numbered_answers = []
-        for i, key in enumerate(sum_dict.keys(), start=1):
-            f.write(f"## {i}. {key.capitalize()}\n")
-            summary = re.sub(r'(1\.[\s])?Summary:', '', sum_dict[key])
-            summary = re.sub(r'(2\.[\s])?Key Concepts(/Facts)?(\:)?\n(\n)?', '### Key concepts\n', summary)
-            summary = re.sub(r'\d+\.\s', '- ', summary)
-            f.write(summary.strip() + "\n\n")
-            
-            # Writing questions
-            f.write("### Questions\n") 
-            # Extract questions and answers using regex
-            questions = re.findall(r"Q:\s.*?(?=\nA:|\Z)", q_dict[key], re.DOTALL)
-            answers = re.findall(r"A:\s.*?(?=\n+Q:|\Z)", q_dict[key], re.DOTALL)
-            # Reformat with Q1:/A1:
-            numbered_questions = [f"- **Q{i}:** {q.strip()[2:].strip()}" for i, q in enumerate(questions, start=1)]
-            numbered_answers.append([f"- **A{i}:** {a.strip()[2:].strip()}" for i, a in enumerate(answers, start=1)])
-            f.write("\n".join(numbered_questions))
-            f.write("\n\n\n")
-
-        # Writing answers
-        f.write("## Answers\n")
-        for i, key in enumerate(sum_dict.keys(), start=1):
-            f.write(f"{i}. {key.capitalize()}\n")
-            f.write("\n".join(numbered_answers[i-1]))
-            f.write("\n\n")
+        f.write(buf.getvalue())
     logger.info("-- MD file generated")
 
 
@@ -253,17 +326,25 @@ class IdlearnCache:
         os.makedirs(".cache/", exist_ok=True)
         
         self.path = ".cache/cache.json"
-        self.data = {'summaries': {}, "qa": {}}
+        self.data = {'summaries': {}, "qa": {}, "texts": {}}
+        # Pending changes and nesting depth of batch() blocks
+        self._dirty = False
+        self._batch_depth = 0
         self.load()
     
     def save(self):
-        with open(self.path, 'w') as f:
-            json.dump(self.data, f, indent=2)
+        # Writing to a temporary file first so that a crash never leaves a truncated cache
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(_dumps(self.data))
+        os.replace(tmp_path, self.path)
     
     def load(self):
         try:
-            with open(self.path, 'r') as f:
+            with open(self.path, 'r', encoding='utf-8') as f:
                 self.data = json.load(f)
+                # Document info stored by earlier versions, never read anymore
+                self.data.pop('pdf_meta', None)
                 self.logger.info("-- Found cache file") 
         except FileNotFoundError:
             self.logger.info("-- Creating cache file") 
@@ -276,13 +357,38 @@ class IdlearnCache:
     def get_qa(self, section):
         return self.data['qa'].get(section)
 
+    def get_texts(self, key):
+        return self.data.setdefault('texts', {}).get(key)
+
     def update_summary(self, section, summary):
         self.data['summaries'][section] = summary
-        self.save()
+        self._mark_dirty()
 
     def update_qa(self, section, qa):
         self.data['qa'][section] = qa
-        self.save()
+        self._mark_dirty()
+
+    def update_texts(self, key, texts):
+        self.data.setdefault('texts', {})[key] = texts
+        self._mark_dirty()
+
+    # Saves right away unless inside a batch() block, which saves once on exit
+    def _mark_dirty(self):
+        self._dirty = True
+        if self._batch_depth == 0:
+            self.save()
+            self._dirty = False
+
+    @contextlib.contextmanager
+    def batch(self):
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0 and self._dirty:
+                self.save()
+                self._dirty = False
 
     def delete(self):
         try: